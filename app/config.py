@@ -14,4 +14,23 @@ class Settings:
     ADOBE_SIGN_BASE_URI = os.getenv("ADOBE_SIGN_BASE_URI")
     ADOBE_SIGN_WEB_URI = os.getenv("ADOBE_SIGN_WEB_URI")
 
+    # Request profiling (disabled unless a token is set)
+    PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+    PROFILING_SLOWEST_N = int(os.getenv("PROFILING_SLOWEST_N", "20"))
+    PROFILING_WINDOW_SECONDS = int(os.getenv("PROFILING_WINDOW_SECONDS", "3600"))
+    PROFILING_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", "5"))
+
+    # Idempotency-Key result cache
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "1000"))
+
+    # Admission control and load shedding
+    ADMISSION_UPLOAD_MAX_CONCURRENT = int(os.getenv("ADMISSION_UPLOAD_MAX_CONCURRENT", "8"))
+    ADMISSION_UPLOAD_MAX_QUEUE = int(os.getenv("ADMISSION_UPLOAD_MAX_QUEUE", "16"))
+    ADMISSION_AGREEMENT_MAX_CONCURRENT = int(os.getenv("ADMISSION_AGREEMENT_MAX_CONCURRENT", "16"))
+    ADMISSION_AGREEMENT_MAX_QUEUE = int(os.getenv("ADMISSION_AGREEMENT_MAX_QUEUE", "32"))
+    ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+    ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "5"))
+    UPLOAD_MAX_INFLIGHT_BYTES = int(os.getenv("UPLOAD_MAX_INFLIGHT_BYTES", str(64 * 1024 * 1024)))
+
 settings = Settings()
\ No newline at end of file
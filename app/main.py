@@ -1,16 +1,28 @@
-from fastapi import FastAPI, HTTPException, Body, Query, Depends, UploadFile, File
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, Body, Query, Depends, UploadFile, File, Header, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse, PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
 from pydantic import BaseModel, EmailStr, validator, Field
+import anyio
+import asyncio
+import functools
 import os
+import json
+import hashlib
 import logging
-from typing import Optional, List
+from typing import Callable, Optional, List
 import re
+import time
+import zlib
+from contextvars import ContextVar
 from datetime import datetime
 
 from app.services.adobe_sign_auth import auth_service
-from app.services.adobe_sign_library import adobe_sign_transient_service, MAX_FILE_SIZE
+from app.services.adobe_sign_library import adobe_sign_transient_service
 from app.services.adobe_sign_agreements import adobe_sign_agreement_service
 from app.services.token_store import token_store
+from app.services.request_profiler import request_profiler
+from app.services.idempotency_store import idempotency_store
+from app.services.admission_control import upload_limiter, agreement_limiter, upload_byte_budget
 
 # Configure logging
 logging.basicConfig(
@@ -23,12 +35,166 @@ logging.basicConfig(
 )
 logger = logging.getLogger("adobe-sign-poc")
 
-# Create the FastAPI application with file size limits
-app = FastAPI(
-    title="Adobe Sign POC",
-    # Limit request body size
-    max_request_size=MAX_FILE_SIZE + 1024 * 1024,  # Add a buffer for non-file parts of request
-)
+# Set by ProfiledRoute for each request: when the endpoint returned, if it did
+_endpoint_returned_at: ContextVar[Optional[List[float]]] = ContextVar("endpoint_returned_at", default=None)
+
+class ProfiledRoute(APIRoute):
+    """
+    Route that attributes the time between the endpoint returning and the
+    response being ready (response_model validation, jsonable_encoder and
+    rendering) to the serialization phase
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if asyncio.iscoroutinefunction(endpoint):
+            original_endpoint = endpoint
+
+            @functools.wraps(original_endpoint)
+            async def endpoint(*args, **kwargs):
+                result = await original_endpoint(*args, **kwargs)
+                returned_at = _endpoint_returned_at.get()
+                if returned_at is not None:
+                    returned_at.append(time.perf_counter())
+                return result
+
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request: Request) -> Response:
+            returned_at = []
+            _endpoint_returned_at.set(returned_at)
+            response = await handler(request)
+            if returned_at:
+                request_profiler.add_phase_time("serialization", (time.perf_counter() - returned_at[0]) * 1000)
+            return response
+
+        return profiled_handler
+
+# Create the FastAPI application; upload body size is limited by admission control
+app = FastAPI(title="Adobe Sign POC")
+app.router.route_class = ProfiledRoute
+
+# Concurrency limit and optional body byte budget per route; routes not listed are not limited
+ROUTE_LIMITERS = {
+    ("POST", "/documents/upload"): (upload_limiter, upload_byte_budget),
+    ("POST", "/agreements/create"): (agreement_limiter, None),
+}
+
+# Registered before the profiling middleware so it runs inside it and
+# queueing time shows up as the admission_wait phase
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Shed load with a 503 when a route's concurrency or byte budget is exhausted"""
+    route_limits = ROUTE_LIMITERS.get((request.method, request.url.path))
+    if route_limits is None:
+        return await call_next(request)
+    limiter, budget = route_limits
+
+    reserved = 0
+    if budget is not None:
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit():
+            reserved = int(content_length)
+            if reserved > budget.max_request_bytes:
+                return JSONResponse(
+                    {"detail": f"Request too large. Maximum size is {budget.max_request_bytes} bytes"},
+                    status_code=413
+                )
+        else:
+            # Without a Content-Length, assume the largest request allowed
+            reserved = budget.max_request_bytes
+
+    try:
+        with request_profiler.phase("admission_wait"):
+            await limiter.acquire()
+    except HTTPException as e:
+        return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+
+    try:
+        if budget is not None:
+            budget.reserve(reserved)
+    except HTTPException as e:
+        limiter.release()
+        return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+
+    try:
+        return await call_next(request)
+    finally:
+        if budget is not None:
+            budget.release(reserved)
+        limiter.release()
+
+# Largest agreement creation body read for an idempotent replay
+MAX_REPLAY_BODY_SIZE = 64 * 1024
+
+# Registered between admission control and profiling: retries of an agreement
+# creation that already completed (or is in flight) are answered here without
+# taking a concurrency slot. Upload retries still go through admission, since
+# their fingerprint needs the whole file spooled and hashed.
+@app.middleware("http")
+async def replay_idempotent_requests(request: Request, call_next):
+    """Answer repeated Idempotency-Key requests to /agreements/create before admission control"""
+    idempotency_key = request.headers.get("idempotency-key")
+    if not idempotency_key or (request.method, request.url.path) != ("POST", "/agreements/create"):
+        return await call_next(request)
+
+    # Only read small bodies ahead of admission control
+    content_length = request.headers.get("content-length")
+    if not content_length or not content_length.isdigit() or int(content_length) > MAX_REPLAY_BODY_SIZE:
+        return await call_next(request)
+
+    try:
+        agreement_request = CreateAgreementRequest(**json.loads(await request.body()))
+    except Exception:
+        # Let the route report the invalid body
+        return await call_next(request)
+
+    try:
+        found, result = await idempotency_store.replay(
+            agreement_idempotency_key(idempotency_key), agreement_fingerprint(agreement_request)
+        )
+    except HTTPException as e:
+        return JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+
+    if not found:
+        return await call_next(request)
+    with request_profiler.phase("serialization"):
+        return JSONResponse(result, headers={"Idempotent-Replayed": "true"})
+
+# Header carrying the profiling token, for per-request profiles and admin endpoints
+PROFILE_HEADER = "X-Profile-Token"
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Time every request by phase and capture a profile when the profiling header is valid"""
+    phases = request_profiler.start_request()
+    profile = None
+    if request_profiler.is_authorized(request.headers.get(PROFILE_HEADER)):
+        profile = request_profiler.start_profile(phases)
+
+    started_at = datetime.now()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        report = request_profiler.stop_profile(profile) if profile else None
+        record = request_profiler.record(
+            request.method, request.url.path, status_code, started_at, duration_ms, phases, profile=report
+        )
+
+    if report is not None:
+        response.headers["X-Profile-Id"] = record["id"]
+    return response
+
+def require_profiling_token(x_profile_token: Optional[str] = Header(None)):
+    """Guard admin profiling endpoints with the profiling token"""
+    if not request_profiler.is_authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Profiling is disabled or the token is invalid")
 
 class UploadResponse(BaseModel):
     transient_document_id: str
@@ -133,29 +299,143 @@ async def auth_status():
                 "message": "Not authenticated"
             }
 
+async def fingerprint_upload(file: UploadFile) -> str:
+    """Hash an uploaded file so a reused Idempotency-Key can be matched to its content"""
+    digest = hashlib.sha256(file.filename.encode() if file.filename else b"")
+    await file.seek(0)
+    while True:
+        chunk = await file.read(1024 * 1024)
+        if not chunk:
+            break
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest()
+
+def mark_replayed(response: Response, replayed: bool):
+    """Flag responses that were served from an earlier call with the same Idempotency-Key"""
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+
 # Document upload route
 @app.post("/documents/upload", response_model=UploadResponse)
-async def upload_document_file(file: UploadFile = File(...)):
+async def upload_document_file(
+    response: Response,
+    file: UploadFile = File(...),
+    idempotency_key: Optional[str] = Header(None)
+):
     """Upload a PDF file directly to create a transient document ID"""
-    try:
-        result = await adobe_sign_transient_service.upload_file_to_transient(file)
-        return {"transient_document_id": result["transientDocumentId"]}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Upload failed: {str(e)}")
+    async def upload():
+        try:
+            result = await adobe_sign_transient_service.upload_file_to_transient(file)
+            return {"transient_document_id": result["transientDocumentId"]}
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Upload failed: {str(e)}")
+
+    if not idempotency_key:
+        return await upload()
+
+    fingerprint = await fingerprint_upload(file)
+    result, replayed = await idempotency_store.run(f"upload:{idempotency_key}", fingerprint, upload)
+    mark_replayed(response, replayed)
+    return result
+
+def agreement_idempotency_key(idempotency_key: str) -> str:
+    """Scope an Idempotency-Key to agreement creation"""
+    return f"agreement:{idempotency_key}"
+
+def agreement_fingerprint(request: CreateAgreementRequest) -> str:
+    """Identify an agreement creation request so a reused Idempotency-Key can be matched to its body"""
+    return json.dumps(request.dict(), sort_keys=True)
 
 # Agreement routes
 @app.post("/agreements/create")
-async def create_agreement(request: CreateAgreementRequest):
+async def create_agreement(
+    request: CreateAgreementRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None)
+):
     """Create an agreement and send it for signing to multiple recipients"""
+    async def create():
+        try:
+            result = await adobe_sign_agreement_service.create_agreement(
+                request.transient_document_id,
+                request.recipient_emails,
+                agreement_name=request.agreement_name
+            )
+            return result
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Agreement creation failed: {str(e)}")
+
+    if not idempotency_key:
+        return await create()
+
+    result, replayed = await idempotency_store.run(
+        agreement_idempotency_key(idempotency_key), agreement_fingerprint(request), create
+    )
+    mark_replayed(response, replayed)
+    return result
+
+def ndjson_line(obj) -> str:
+    """Encode one compact NDJSON line"""
+    return json.dumps(obj, separators=(",", ":")) + "\n"
+
+async def stream_agreements_ndjson(pages, first_page, compress: bool):
+    """
+    Stream agreement pages as NDJSON, optionally gzip-compressed
+
+    Each agreement is one line. After every page a `{"_cursor": ...}` line gives
+    the cursor to resume from; it is null once the export is complete.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(lines: List[str]) -> bytes:
+        data = "".join(lines).encode()
+        if compressor is None:
+            return data
+        # Sync flush so each page reaches the client without waiting for the next
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
     try:
-        result = await adobe_sign_agreement_service.create_agreement(
-            request.transient_document_id,
-            request.recipient_emails,
-            agreement_name=request.agreement_name
-        )
-        return result
+        page = first_page
+        while page is not None:
+            agreements, next_cursor = page
+            lines = [ndjson_line(agreement) for agreement in agreements]
+            lines.append(ndjson_line({"_cursor": next_cursor}))
+            yield encode(lines)
+            page = await pages.__anext__() if next_cursor else None
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Agreement creation failed: {str(e)}")
+        # Headers are already sent, so report the failure in-band
+        logger.error(f"Agreement export failed: {str(e)}", exc_info=True)
+        yield encode([ndjson_line({"_error": f"Agreement export failed: {str(e)}"})])
+    finally:
+        # Shielded so a client disconnect doesn't cancel the cleanup, see iter_agreement_pages
+        with anyio.CancelScope(shield=True):
+            await pages.aclose()
+
+    if compressor is not None:
+        yield compressor.flush()
+
+@app.get("/agreements/export")
+async def export_agreements(
+    cursor: Optional[str] = None,
+    page_size: int = Query(100, ge=1, le=100),
+    gzip: bool = False
+):
+    """Export all agreements of the account as NDJSON, resumable from a returned cursor"""
+    pages = adobe_sign_agreement_service.iter_agreement_pages(cursor=cursor, page_size=page_size)
+    try:
+        # Fetch the first page up front so errors still get a proper status code
+        first_page = await pages.__anext__()
+    except Exception as e:
+        await pages.aclose()
+        raise HTTPException(status_code=400, detail=f"Agreement export failed: {str(e)}")
+
+    headers = {"Content-Encoding": "gzip"} if gzip else {}
+    return StreamingResponse(
+        stream_agreements_ndjson(pages, first_page, gzip),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
 
 @app.get("/agreements/{agreement_id}")
 async def get_agreement(agreement_id: str):
@@ -166,6 +446,26 @@ async def get_agreement(agreement_id: str):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to fetch agreement: {str(e)}")
 
+# Profiling admin routes
+@app.get("/admin/profiling/requests", dependencies=[Depends(require_profiling_token)])
+async def get_slowest_requests():
+    """Get the slowest recent requests with their phase breakdown"""
+    return {"requests": request_profiler.get_slowest()}
+
+@app.get("/admin/profiling/requests/{request_id}/profile", dependencies=[Depends(require_profiling_token)])
+async def get_request_profile(request_id: str):
+    """Get the captured profile report for a profiled request"""
+    report = request_profiler.get_profile(request_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail=f"No profile captured for request {request_id}")
+    return PlainTextResponse(report)
+
+@app.delete("/admin/profiling/requests", dependencies=[Depends(require_profiling_token)])
+async def clear_profiling_records():
+    """Clear the recorded slow requests and profiles"""
+    request_profiler.clear()
+    return {"status": "cleared"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+from fastapi import HTTPException
+
+from app.config import settings
+from app.services.adobe_sign_library import MAX_FILE_SIZE
+
+logger = logging.getLogger("adobe-sign-poc")
+
+def _overloaded(detail: str, retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail=detail,
+        headers={"Retry-After": str(retry_after)}
+    )
+
+class ConcurrencyLimiter:
+    """
+    Limits how many requests of a route run at once.
+
+    Requests beyond the limit wait in a bounded queue. When the queue is full,
+    or a request waits longer than the queue timeout, it is rejected with a 503.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int,
+                 queue_timeout: float = None, retry_after: int = None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout if queue_timeout is not None else settings.ADMISSION_QUEUE_TIMEOUT_SECONDS
+        self.retry_after = retry_after if retry_after is not None else settings.ADMISSION_RETRY_AFTER_SECONDS
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.waiting = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self.max_concurrent - self._semaphore._value
+
+    async def acquire(self):
+        """Take a slot, waiting in the queue if needed; raises a 503 HTTPException when shedding"""
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+            return
+
+        if self.waiting >= self.max_queue:
+            logger.warning(f"Shedding {self.name} request: {self.in_flight} in flight, {self.waiting} queued")
+            raise _overloaded(f"Too many concurrent {self.name} requests, please retry later", self.retry_after)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shedding {self.name} request after waiting {self.queue_timeout}s in queue")
+            raise _overloaded(f"Timed out waiting for a {self.name} slot, please retry later", self.retry_after)
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        """Give back a slot taken with acquire()"""
+        self._semaphore.release()
+
+class ByteBudget:
+    """
+    Caps the total size of request bodies being processed at once.
+
+    Reservations that would exceed the budget are rejected immediately with a 503.
+    `max_request_bytes` is the largest single body accepted; callers reject
+    larger requests with a 413 and reserve it for bodies of unknown size.
+    """
+
+    def __init__(self, name: str, max_bytes: int, max_request_bytes: int, retry_after: int = None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_request_bytes = max_request_bytes
+        self.retry_after = retry_after if retry_after is not None else settings.ADMISSION_RETRY_AFTER_SECONDS
+        self.in_flight = 0
+
+    def reserve(self, size: int):
+        """Reserve bytes for a request; raises a 503 HTTPException when over budget"""
+        if self.in_flight + size > self.max_bytes:
+            logger.warning(f"Shedding {self.name} request: {self.in_flight} of {self.max_bytes} bytes in flight")
+            raise _overloaded(f"Too much {self.name} data in flight, please retry later", self.retry_after)
+        self.in_flight += size
+
+    def release(self, size: int):
+        """Give back bytes reserved with reserve()"""
+        self.in_flight -= size
+
+upload_limiter = ConcurrencyLimiter(
+    "upload",
+    max_concurrent=settings.ADMISSION_UPLOAD_MAX_CONCURRENT,
+    max_queue=settings.ADMISSION_UPLOAD_MAX_QUEUE
+)
+agreement_limiter = ConcurrencyLimiter(
+    "agreement creation",
+    max_concurrent=settings.ADMISSION_AGREEMENT_MAX_CONCURRENT,
+    max_queue=settings.ADMISSION_AGREEMENT_MAX_QUEUE
+)
+upload_byte_budget = ByteBudget(
+    "upload",
+    max_bytes=settings.UPLOAD_MAX_INFLIGHT_BYTES,
+    # Add a buffer for non-file parts of the multipart body
+    max_request_bytes=MAX_FILE_SIZE + 1024 * 1024
+)
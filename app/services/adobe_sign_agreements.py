@@ -1,9 +1,12 @@
+import asyncio
+import anyio
 import httpx
 from fastapi import HTTPException
 from app.services.adobe_sign_auth import auth_service
 from app.services.token_store import token_store
+from app.services.request_profiler import request_profiler
 import logging
-from typing import List
+from typing import List, Optional
 
 logger = logging.getLogger("adobe-sign-poc")
 
@@ -21,7 +24,8 @@ class AdobeSignAgreementService:
             The created agreement information
         """
         # Make sure we have a valid token, refresh if needed
-        await auth_service.refresh_token_if_needed()
+        with request_profiler.phase("token_refresh"):
+            await auth_service.refresh_token_if_needed()
         if not auth_service.access_token:
             raise HTTPException(status_code=401, detail="Not authenticated with Adobe Sign.")
 
@@ -68,30 +72,36 @@ class AdobeSignAgreementService:
         }
 
         async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload)
+            with request_profiler.phase("upstream_wait"):
+                response = await client.post(url, headers=headers, json=payload)
             if response.status_code not in (200, 201):
                 # If token expired, try once more after refresh
                 if response.status_code == 401:
                     logger.info("Token expired during agreement creation, refreshing...")
-                    refresh_result = await auth_service.refresh_token_if_needed()
+                    with request_profiler.phase("token_refresh"):
+                        refresh_result = await auth_service.refresh_token_if_needed()
                     if refresh_result:
                         # Retry with new token
                         headers["Authorization"] = f"Bearer {auth_service.access_token}"
-                        response = await client.post(url, headers=headers, json=payload)
+                        with request_profiler.phase("upstream_wait"):
+                            response = await client.post(url, headers=headers, json=payload)
                         if response.status_code in (200, 201):
-                            return response.json()
+                            with request_profiler.phase("upstream_decode"):
+                                return response.json()
 
                 # If still failing or not an auth issue
                 raise HTTPException(
                     status_code=response.status_code,
                     detail=f"Failed to create agreement: {response.text}"
                 )
-            return response.json()
+            with request_profiler.phase("upstream_decode"):
+                return response.json()
     
     async def get_agreement(self, agreement_id: str):
         """Get agreement details by ID"""
         # Make sure we have a valid token, refresh if needed
-        await auth_service.refresh_token_if_needed()
+        with request_profiler.phase("token_refresh"):
+            await auth_service.refresh_token_if_needed()
         if not auth_service.access_token:
             raise HTTPException(status_code=401, detail="Not authenticated with Adobe Sign.")
         
@@ -104,24 +114,117 @@ class AdobeSignAgreementService:
         }
         
         async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
+            with request_profiler.phase("upstream_wait"):
+                response = await client.get(url, headers=headers)
             if response.status_code != 200:
                 # If token expired, try once more after refresh
                 if response.status_code == 401:
                     logger.info("Token expired during agreement retrieval, refreshing...")
-                    refresh_result = await auth_service.refresh_token_if_needed()
+                    with request_profiler.phase("token_refresh"):
+                        refresh_result = await auth_service.refresh_token_if_needed()
                     if refresh_result:
                         # Retry with new token
                         headers["Authorization"] = f"Bearer {auth_service.access_token}"
-                        response = await client.get(url, headers=headers)
+                        with request_profiler.phase("upstream_wait"):
+                            response = await client.get(url, headers=headers)
                         if response.status_code == 200:
-                            return response.json()
+                            with request_profiler.phase("upstream_decode"):
+                                return response.json()
                 
                 # If still failing or not an auth issue
                 raise HTTPException(
                     status_code=response.status_code,
                     detail=f"Failed to get agreement: {response.text}"
                 )
+            with request_profiler.phase("upstream_decode"):
+                return response.json()
+
+    async def _fetch_agreements_page(self, client: httpx.AsyncClient, cursor: Optional[str] = None, page_size: int = 100):
+        """Fetch one page of the agreements listing"""
+        # Make sure we have a valid token, refresh if needed
+        with request_profiler.phase("token_refresh"):
+            await auth_service.refresh_token_if_needed()
+        if not auth_service.access_token:
+            raise HTTPException(status_code=401, detail="Not authenticated with Adobe Sign.")
+
+        # Get base URI from stored settings
+        base_uri = token_store.get_api_access_point() or auth_service.base_uri
+
+        url = f"{base_uri}api/rest/v6/agreements"
+        headers = {
+            "Authorization": f"Bearer {auth_service.access_token}"
+        }
+        params = {"pageSize": page_size}
+        if cursor:
+            params["cursor"] = cursor
+
+        with request_profiler.phase("upstream_wait"):
+            response = await client.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            # If token expired, try once more after refresh
+            if response.status_code == 401:
+                logger.info("Token expired during agreement listing, refreshing...")
+                with request_profiler.phase("token_refresh"):
+                    refresh_result = await auth_service.refresh_token_if_needed()
+                if refresh_result:
+                    # Retry with new token
+                    headers["Authorization"] = f"Bearer {auth_service.access_token}"
+                    with request_profiler.phase("upstream_wait"):
+                        response = await client.get(url, headers=headers, params=params)
+                    if response.status_code == 200:
+                        with request_profiler.phase("upstream_decode"):
+                            return response.json()
+
+            # If still failing or not an auth issue
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=f"Failed to list agreements: {response.text}"
+            )
+        with request_profiler.phase("upstream_decode"):
             return response.json()
 
+    async def iter_agreement_pages(self, cursor: Optional[str] = None, page_size: int = 100):
+        """
+        Walk the agreements listing page by page
+
+        The next page is fetched in the background while the caller consumes the
+        current one, so at most two pages are held in memory at a time.
+
+        Args:
+            cursor: Cursor to resume from, as returned with a previous page
+            page_size: Number of agreements per page
+
+        Yields:
+            Tuples of (agreements, next_cursor); next_cursor is None on the last page
+        """
+        # Closed explicitly rather than with `async with`, since the generator may
+        # be resumed and closed from different tasks (e.g. a streaming response)
+        client = httpx.AsyncClient()
+        prefetch = None
+        try:
+            page = await self._fetch_agreements_page(client, cursor, page_size)
+            while True:
+                next_cursor = (page.get("page") or {}).get("nextCursor") or None
+                if next_cursor:
+                    prefetch = asyncio.create_task(
+                        self._fetch_agreements_page(client, next_cursor, page_size)
+                    )
+                yield page.get("userAgreementList", []), next_cursor
+                if prefetch is None:
+                    return
+                page = await prefetch
+                prefetch = None
+        finally:
+            # Shielded: on client disconnect Starlette cancels the stream through an
+            # anyio task group, which would otherwise cancel these awaits as well
+            # and leave the client's connection pool open
+            with anyio.CancelScope(shield=True):
+                if prefetch is not None:
+                    # Discard the unused page, including any error fetching it
+                    prefetch.cancel()
+                    await asyncio.wait([prefetch])
+                    if not prefetch.cancelled():
+                        prefetch.exception()
+                await client.aclose()
+
 adobe_sign_agreement_service = AdobeSignAgreementService()
@@ -4,6 +4,7 @@ import os
 from fastapi import HTTPException, UploadFile
 from app.services.adobe_sign_auth import auth_service
 from app.services.token_store import token_store
+from app.services.request_profiler import request_profiler
 import logging
 import http.client as http_client
 
@@ -26,7 +27,8 @@ class AdobeSignTransientService:
         Upload a file directly from a request to Adobe Sign's transient documents
         """
         # Make sure we have a valid token, refresh if needed
-        await auth_service.refresh_token_if_needed()
+        with request_profiler.phase("token_refresh"):
+            await auth_service.refresh_token_if_needed()
         access_token = auth_service.access_token
         if not access_token:
             raise HTTPException(status_code=401, detail="Not authenticated with Adobe Sign.")
@@ -48,7 +50,7 @@ class AdobeSignTransientService:
             # Ensure file is at the beginning
             await file.seek(0)
             
-            with open(temp_file_path, "wb") as temp_file:
+            with request_profiler.phase("upload_io"), open(temp_file_path, "wb") as temp_file:
                 # Read and write the file in chunks to avoid memory issues
                 while True:
                     chunk = await file.read(chunk_size)
@@ -77,13 +79,15 @@ class AdobeSignTransientService:
                 files = {
                     "File": (file.filename, f, "application/pdf")
                 }
-                response = requests.post(url, headers=headers, files=files)
+                with request_profiler.phase("upstream_wait"):
+                    response = requests.post(url, headers=headers, files=files)
             
             if response.status_code not in (200, 201):
                 # If unauthorized, try to refresh token and retry
                 if response.status_code == 401:
                     logger.warning("Unauthorized request, attempting to refresh token")
-                    refresh_result = await auth_service.refresh_token_if_needed()
+                    with request_profiler.phase("token_refresh"):
+                        refresh_result = await auth_service.refresh_token_if_needed()
                     if refresh_result:
                         # Reset the file position to the beginning
                         await file.seek(0)
@@ -95,7 +99,8 @@ class AdobeSignTransientService:
                             files = {
                                 "File": (file.filename, f, "application/pdf")
                             }
-                            response = requests.post(url, headers=headers, files=files)
+                            with request_profiler.phase("upstream_wait"):
+                                response = requests.post(url, headers=headers, files=files)
                         
                         # If still failing after refresh, raise error
                         if response.status_code not in (200, 201):
@@ -104,7 +109,8 @@ class AdobeSignTransientService:
                                 detail=f"Failed to upload PDF to Adobe Sign transientDocuments: {response.text}"
                             )
                         
-                        return response.json()
+                        with request_profiler.phase("upstream_decode"):
+                            return response.json()
                 
                 # If we got here, the request failed
                 raise HTTPException(
@@ -112,7 +118,8 @@ class AdobeSignTransientService:
                     detail=f"Failed to upload PDF to Adobe Sign transientDocuments: {response.text}"
                 )
                 
-            return response.json()
+            with request_profiler.phase("upstream_decode"):
+                return response.json()
             
         finally:
             # Clean up the temporary file
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from fastapi import HTTPException
+
+from app.config import settings
+
+logger = logging.getLogger("adobe-sign-poc")
+
+class IdempotencyStore:
+    """
+    In-memory store for Idempotency-Key handling.
+
+    Keeps in-flight calls so concurrent duplicates wait on the original, and
+    completed results in a bounded, TTL-evicted cache so later retries are
+    answered without repeating the upstream work. Failed calls are not cached.
+    """
+
+    def __init__(self, ttl_seconds: int = None, max_entries: int = None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.IDEMPOTENCY_TTL_SECONDS
+        self.max_entries = max_entries if max_entries is not None else settings.IDEMPOTENCY_MAX_ENTRIES
+        # key -> (fingerprint, future)
+        self._in_flight: Dict[str, tuple] = {}
+        # key -> (fingerprint, result, expires_at), ordered by completion time
+        self._completed: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def _evict(self):
+        """Drop expired results, then the oldest results beyond the size limit"""
+        now = time.monotonic()
+        while self._completed:
+            key, (_, _, expires_at) = next(iter(self._completed.items()))
+            if expires_at > now and len(self._completed) <= self.max_entries:
+                break
+            self._completed.popitem(last=False)
+
+    def _check_fingerprint(self, key: str, stored: str, fingerprint: str):
+        if stored != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Idempotency-Key {key} was already used with a different request"
+            )
+
+    async def replay(self, key: str, fingerprint: str):
+        """
+        Get the result of an earlier call with this key, waiting for it if still in flight
+
+        Returns:
+            A tuple of (found, result); found is False if no call with this key is known
+        """
+        self._evict()
+
+        if key in self._completed:
+            stored, result, _ = self._completed[key]
+            self._check_fingerprint(key, stored, fingerprint)
+            logger.info(f"Replaying cached result for idempotency key {key}")
+            return True, result
+
+        if key in self._in_flight:
+            stored, future = self._in_flight[key]
+            self._check_fingerprint(key, stored, fingerprint)
+            logger.info(f"Waiting on in-flight request for idempotency key {key}")
+            # Shield so a disconnecting duplicate doesn't cancel the shared result
+            return True, await asyncio.shield(future)
+
+        return False, None
+
+    async def run(self, key: str, fingerprint: str, func: Callable[[], Awaitable[Any]]):
+        """
+        Run `func` at most once per key and return its result
+
+        Args:
+            key: The idempotency key, scoped by the caller (e.g. to the route)
+            fingerprint: Identifies the request body; reusing a key with another body is rejected
+            func: Coroutine function performing the actual work
+
+        Returns:
+            A tuple of (result, replayed) where replayed is True if the result was not produced by this call
+        """
+        found, result = await self.replay(key, fingerprint)
+        if found:
+            return result, True
+
+        # No await between the lookup above and registering the call below,
+        # so a concurrent duplicate can't slip in between
+        future = asyncio.get_running_loop().create_future()
+        # Mark exceptions as retrieved when no duplicate is waiting on them
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = (fingerprint, future)
+        try:
+            result = await func()
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.set_exception(HTTPException(
+                status_code=409,
+                detail=f"Original request for Idempotency-Key {key} was cancelled, please retry"
+            ))
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+
+        self._completed[key] = (fingerprint, result, time.monotonic() + self.ttl_seconds)
+        self._evict()
+        future.set_result(result)
+        return result, False
+
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,233 @@
+import asyncio
+import hmac
+import heapq
+import itertools
+import logging
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.config import settings
+
+logger = logging.getLogger("adobe-sign-poc")
+
+# Phase timings for the request currently being handled. The middleware sets a
+# fresh dict per request; services add to it through `request_profiler.phase()`.
+_current_phases: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_phases", default=None)
+
+# Phases reported for every request, even when a phase did not run
+PHASES = ("admission_wait", "token_refresh", "upload_io", "upstream_wait", "upstream_decode", "serialization")
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the event loop thread's stack at a fixed interval.
+
+    Only samples taken while the loop is running one of the profiled request's
+    tasks are kept; time the request spends suspended (e.g. waiting on Adobe Sign)
+    is covered by the phase timings instead. Tasks are matched through their
+    context, which needs Python 3.12+; on older versions every sample taken while
+    the request is in flight is kept, including other requests' work.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, thread_id: int,
+                 phases: Dict[str, float], interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.loop = loop
+        self.thread_id = thread_id
+        self.phases = phases
+        self.interval = interval
+        self.samples = Counter()  # stack (outermost first) -> sample count
+        self._stop_event = threading.Event()
+
+    def _is_profiled_task(self) -> bool:
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            # The loop is polling for I/O or running plain callbacks
+            return False
+        get_context = getattr(task, "get_context", None)
+        if get_context is None:
+            return True
+        return get_context().get(_current_phases) is self.phases
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            if not self._is_profiled_task():
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def report(self, limit: int = 30) -> str:
+        """Render the functions seen most often, by own and by inclusive samples"""
+        total = sum(self.samples.values())
+        lines = [f"{total} samples every {self.interval * 1000:g}ms on the event loop thread"]
+        if not total:
+            return "\n".join(lines) + "\n"
+
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self.samples.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                inclusive[function] += count
+
+        for title, counts in (("Own samples", own), ("Inclusive samples", inclusive)):
+            lines.append("")
+            lines.append(title)
+            for function, count in counts.most_common(limit):
+                lines.append(f"{count / total:7.1%} {count:6d}  {function}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestProfiler:
+    """
+    Opt-in profiling for API requests.
+
+    This service is responsible for:
+    1. Timing the phases of a request (admission wait, token refresh, upload I/O,
+       upstream wait and decode, response serialization)
+    2. Keeping a rolling record of the slowest N requests within a time window
+    3. Capturing a sampling profile for requests that carry the profiling header
+    """
+
+    def __init__(self):
+        self.token = settings.PROFILING_TOKEN
+        self.max_records = settings.PROFILING_SLOWEST_N
+        self.window_seconds = settings.PROFILING_WINDOW_SECONDS
+        self.sample_interval = settings.PROFILING_SAMPLE_INTERVAL_MS / 1000
+        self._slowest = []  # min-heap of (duration_ms, seq, recorded_at, record)
+        self._profiles = OrderedDict()  # request id -> profile report
+        self._seq = itertools.count()
+        # Bound the sampling overhead to one profiled request at a time
+        self._profile_lock = threading.Lock()
+
+    def is_authorized(self, header_value: Optional[str]) -> bool:
+        """Check a profiling/admin header against the configured token"""
+        if not self.token or header_value is None:
+            return False
+        return hmac.compare_digest(header_value.encode(), self.token.encode())
+
+    def start_request(self) -> Dict[str, float]:
+        """Start collecting phase timings for the current request"""
+        phases = {name: 0.0 for name in PHASES}
+        _current_phases.set(phases)
+        return phases
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a block of work and attribute it to a phase of the current request.
+
+        Outside of a request (e.g. in scripts) this is a no-op.
+        """
+        if _current_phases.get() is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase_time(name, (time.perf_counter() - start) * 1000)
+
+    def add_phase_time(self, name: str, elapsed_ms: float):
+        """Attribute time measured elsewhere to a phase of the current request"""
+        phases = _current_phases.get()
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + elapsed_ms
+
+    def start_profile(self, phases: Dict[str, float]) -> Optional[StackSampler]:
+        """
+        Start sampling the current request, if no other request is being profiled.
+
+        Must be called from the event loop thread, after `start_request()`.
+        """
+        if not self._profile_lock.acquire(blocking=False):
+            logger.warning("Profiling already in progress, skipping profile capture")
+            return None
+        sampler = StackSampler(
+            asyncio.get_running_loop(), threading.get_ident(), phases, self.sample_interval
+        )
+        sampler.start()
+        return sampler
+
+    def stop_profile(self, sampler: StackSampler) -> str:
+        """Stop sampling a request and render its report"""
+        try:
+            sampler.stop()
+        finally:
+            self._profile_lock.release()
+        return sampler.report()
+
+    def _prune(self):
+        """Drop recorded requests that fell out of the rolling window"""
+        cutoff = time.monotonic() - self.window_seconds
+        if any(recorded_at < cutoff for _, _, recorded_at, _ in self._slowest):
+            self._slowest = [entry for entry in self._slowest if entry[2] >= cutoff]
+            heapq.heapify(self._slowest)
+
+    def record(self, method: str, path: str, status_code: int, started_at: datetime,
+               duration_ms: float, phases: Dict[str, float], profile: Optional[str] = None) -> Dict:
+        """
+        Record a finished request, keeping it only if it is among the slowest N
+
+        Returns:
+            The request record, including its generated ID
+        """
+        record = {
+            "id": uuid.uuid4().hex,
+            "method": method,
+            "path": path,
+            "status_code": status_code,
+            "started_at": started_at.isoformat(),
+            "duration_ms": round(duration_ms, 3),
+            # Copy so late work (e.g. streaming bodies) doesn't change the record
+            "phases": {name: round(ms, 3) for name, ms in phases.items()},
+            "profiled": profile is not None,
+        }
+        record["phases"]["other"] = round(max(duration_ms - sum(phases.values()), 0.0), 3)
+
+        self._prune()
+        entry = (duration_ms, next(self._seq), time.monotonic(), record)
+        if len(self._slowest) < self.max_records:
+            heapq.heappush(self._slowest, entry)
+        elif self.max_records and duration_ms > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+        if profile is not None:
+            self._profiles[record["id"]] = profile
+            while len(self._profiles) > self.max_records:
+                self._profiles.popitem(last=False)
+
+        return record
+
+    def get_slowest(self) -> List[Dict]:
+        """Get the slowest requests within the window, slowest first"""
+        self._prune()
+        return [entry[3] for entry in sorted(self._slowest, key=lambda e: (-e[0], e[1]))]
+
+    def get_profile(self, request_id: str) -> Optional[str]:
+        """Get the captured profile report for a request"""
+        return self._profiles.get(request_id)
+
+    def clear(self):
+        """Clear all recorded requests and profiles"""
+        self._slowest = []
+        self._profiles.clear()
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,50 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.services.admission_control import ConcurrencyLimiter, ByteBudget
+
+def test_sheds_when_queue_is_full():
+    limiter = ConcurrencyLimiter("test", max_concurrent=1, max_queue=1, queue_timeout=1, retry_after=3)
+
+    async def run():
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+
+        with pytest.raises(HTTPException) as exc_info:
+            await limiter.acquire()
+
+        limiter.release()
+        await queued
+        limiter.release()
+        return exc_info.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "3"}
+    assert limiter.in_flight == 0
+
+def test_sheds_after_queue_timeout():
+    limiter = ConcurrencyLimiter("test", max_concurrent=1, max_queue=5, queue_timeout=0.01, retry_after=3)
+
+    async def run():
+        await limiter.acquire()
+        with pytest.raises(HTTPException):
+            await limiter.acquire()
+        assert limiter.waiting == 0
+        limiter.release()
+
+    asyncio.run(run())
+
+def test_byte_budget():
+    budget = ByteBudget("upload", max_bytes=100, max_request_bytes=100, retry_after=3)
+
+    budget.reserve(60)
+    with pytest.raises(HTTPException) as exc_info:
+        budget.reserve(50)
+    assert exc_info.value.status_code == 503
+
+    budget.release(60)
+    budget.reserve(100)
+    assert budget.in_flight == 100
@@ -1,4 +1,5 @@
-from app.services.adobe_sign_agreements import adobe_sign_agreement_service
+from app.services.adobe_sign_agreements import adobe_sign_agreement_service, AdobeSignAgreementService
+import asyncio
 import os
 def test_create_agreement():
     # Use your actual transient document ID here
@@ -18,5 +19,29 @@ def test_create_agreement():
     except Exception as e:
         print(f"\nError: {e}")
 
+def test_iter_agreement_pages_prefetches_next_page():
+    service = AdobeSignAgreementService()
+    fetched = []
+
+    async def fetch_page(client, cursor=None, page_size=100):
+        fetched.append(cursor)
+        next_cursor = {None: "page-2", "page-2": None}[cursor]
+        return {"userAgreementList": [{"id": cursor or "page-1"}], "page": {"nextCursor": next_cursor}}
+
+    service._fetch_agreements_page = fetch_page
+
+    async def collect():
+        pages = []
+        async for agreements, next_cursor in service.iter_agreement_pages():
+            # Let the prefetch task run before the page is consumed
+            await asyncio.sleep(0)
+            pages.append((agreements, next_cursor, list(fetched)))
+        return pages
+
+    pages = asyncio.run(collect())
+
+    assert pages[0] == ([{"id": "page-1"}], "page-2", [None, "page-2"])
+    assert pages[1] == ([{"id": "page-2"}], None, [None, "page-2"])
+
 if __name__ == "__main__":
     test_create_agreement()
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.services.idempotency_store import IdempotencyStore
+
+def test_concurrent_duplicates_share_one_call():
+    store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+    calls = []
+
+    async def create():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": "agreement-1"}
+
+    async def run_duplicates():
+        first, second = await asyncio.gather(
+            store.run("key-1", "body", create),
+            store.run("key-1", "body", create),
+        )
+        later = await store.run("key-1", "body", create)
+        return first, second, later
+
+    first, second, later = asyncio.run(run_duplicates())
+
+    assert len(calls) == 1
+    assert first == ({"id": "agreement-1"}, False)
+    assert second == ({"id": "agreement-1"}, True)
+    assert later == ({"id": "agreement-1"}, True)
+
+def test_failures_are_not_cached():
+    store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+
+    async def fail():
+        raise HTTPException(status_code=400, detail="Upstream failed")
+
+    async def succeed():
+        return {"id": "agreement-2"}
+
+    with pytest.raises(HTTPException):
+        asyncio.run(store.run("key-2", "body", fail))
+    assert asyncio.run(store.run("key-2", "body", succeed)) == ({"id": "agreement-2"}, False)
+
+def test_reused_key_with_different_body_is_rejected():
+    store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+
+    async def succeed():
+        return {"id": "agreement-3"}
+
+    asyncio.run(store.run("key-3", "body", succeed))
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(store.run("key-3", "other body", succeed))
+    assert exc_info.value.status_code == 422
+
+def test_expired_and_excess_entries_are_evicted():
+    store = IdempotencyStore(ttl_seconds=0, max_entries=10)
+
+    async def succeed():
+        return {"id": "agreement-4"}
+
+    asyncio.run(store.run("key-4", "body", succeed))
+    assert asyncio.run(store.run("key-4", "body", succeed)) == ({"id": "agreement-4"}, False)
+
+    store = IdempotencyStore(ttl_seconds=60, max_entries=1)
+    asyncio.run(store.run("key-5", "body", succeed))
+    asyncio.run(store.run("key-6", "body", succeed))
+    assert list(store._completed) == ["key-6"]
+
+def test_replay_only_finds_known_keys():
+    store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+
+    async def succeed():
+        return {"id": "agreement-7"}
+
+    assert asyncio.run(store.replay("key-7", "body")) == (False, None)
+    asyncio.run(store.run("key-7", "body", succeed))
+    assert asyncio.run(store.replay("key-7", "body")) == (True, {"id": "agreement-7"})
@@ -0,0 +1,205 @@
+import anyio
+import asyncio
+import gzip
+import json
+import time
+import httpx
+from pydantic import BaseModel, field_serializer
+from app import main
+from app.services.admission_control import ConcurrencyLimiter, ByteBudget
+from app.services.idempotency_store import IdempotencyStore
+
+AGREEMENT_BODY = {"transient_document_id": "doc-1", "recipient_emails": ["signer@example.com"]}
+
+def run_requests(requests):
+    """Send requests concurrently to the app and return the responses"""
+    async def send():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+            return await asyncio.gather(*[client.request(**request) for request in requests])
+    return asyncio.run(send())
+
+def test_idempotent_replay_skips_admission(monkeypatch):
+    calls = []
+
+    async def create_agreement(transient_document_id, recipient_emails, agreement_name=None):
+        calls.append(transient_document_id)
+        return {"id": "agreement-1"}
+
+    limiter = ConcurrencyLimiter("agreement creation", max_concurrent=1, max_queue=0, queue_timeout=1, retry_after=1)
+    monkeypatch.setattr(main.adobe_sign_agreement_service, "create_agreement", create_agreement)
+    monkeypatch.setattr(main, "idempotency_store", IdempotencyStore(ttl_seconds=60, max_entries=10))
+    monkeypatch.setitem(main.ROUTE_LIMITERS, ("POST", "/agreements/create"), (limiter, None))
+
+    request = {"method": "POST", "url": "/agreements/create", "json": AGREEMENT_BODY,
+               "headers": {"Idempotency-Key": "key-1"}}
+    first, = run_requests([request])
+
+    async def hold_slot_and_retry():
+        # With the only slot taken, a retry can only succeed through the replay path
+        await limiter.acquire()
+        try:
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                return await client.request(**request)
+        finally:
+            limiter.release()
+
+    retry = asyncio.run(hold_slot_and_retry())
+
+    assert first.status_code == 200
+    assert retry.status_code == 200
+    assert retry.json() == {"id": "agreement-1"}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert calls == ["doc-1"]
+
+async def fake_pages(pages, fail_after=None):
+    """Stand-in for iter_agreement_pages yielding (agreements, next_cursor) tuples"""
+    for i, page in enumerate(pages):
+        if fail_after is not None and i > fail_after:
+            raise Exception("upstream down")
+        yield page
+
+def collect_export(pages, compress=False, fail_after=None):
+    async def collect():
+        page_iter = fake_pages(pages, fail_after)
+        first_page = await page_iter.__anext__()
+        return b"".join([chunk async for chunk in main.stream_agreements_ndjson(page_iter, first_page, compress)])
+    return asyncio.run(collect())
+
+EXPORT_PAGES = [([{"id": "a1"}, {"id": "a2"}], "cursor-2"), ([{"id": "a3"}], None)]
+EXPORT_LINES = ['{"id":"a1"}', '{"id":"a2"}', '{"_cursor":"cursor-2"}', '{"id":"a3"}', '{"_cursor":null}']
+
+def test_export_emits_cursor_after_each_page():
+    assert collect_export(EXPORT_PAGES).decode().splitlines() == EXPORT_LINES
+
+def test_export_gzip_output_decompresses():
+    assert gzip.decompress(collect_export(EXPORT_PAGES, compress=True)).decode().splitlines() == EXPORT_LINES
+
+def test_export_reports_later_failures_in_band():
+    lines = collect_export(EXPORT_PAGES + [([{"id": "a4"}], None)], fail_after=0).decode().splitlines()
+    assert lines[:3] == EXPORT_LINES[:3]
+    assert json.loads(lines[3]) == {"_error": "Agreement export failed: upstream down"}
+
+def test_export_resumes_from_cursor(monkeypatch):
+    listing = {
+        None: {"userAgreementList": [{"id": "a1"}], "page": {"nextCursor": "cursor-2"}},
+        "cursor-2": {"userAgreementList": [{"id": "a2"}], "page": {}},
+    }
+
+    async def fetch_page(client, cursor=None, page_size=100):
+        return listing[cursor]
+
+    monkeypatch.setattr(main.adobe_sign_agreement_service, "_fetch_agreements_page", fetch_page)
+
+    full, resumed = run_requests([
+        {"method": "GET", "url": "/agreements/export"},
+        {"method": "GET", "url": "/agreements/export", "params": {"cursor": "cursor-2"}},
+    ])
+
+    assert full.headers["content-type"] == "application/x-ndjson"
+    assert full.text.splitlines() == ['{"id":"a1"}', '{"_cursor":"cursor-2"}', '{"id":"a2"}', '{"_cursor":null}']
+    assert resumed.text.splitlines() == ['{"id":"a2"}', '{"_cursor":null}']
+
+def test_full_queue_sheds_with_retry_after(monkeypatch):
+    async def create_agreement(transient_document_id, recipient_emails, agreement_name=None):
+        await asyncio.sleep(0.1)
+        return {"id": transient_document_id}
+
+    limiter = ConcurrencyLimiter("agreement creation", max_concurrent=1, max_queue=1, queue_timeout=5, retry_after=7)
+    monkeypatch.setattr(main.adobe_sign_agreement_service, "create_agreement", create_agreement)
+    monkeypatch.setitem(main.ROUTE_LIMITERS, ("POST", "/agreements/create"), (limiter, None))
+
+    responses = run_requests([{"method": "POST", "url": "/agreements/create", "json": AGREEMENT_BODY}] * 3)
+
+    assert sorted(r.status_code for r in responses) == [200, 200, 503]
+    shed = next(r for r in responses if r.status_code == 503)
+    assert shed.headers["Retry-After"] == "7"
+    assert limiter.in_flight == 0
+
+def test_upload_reserves_content_length(monkeypatch):
+    budget = ByteBudget("upload", max_bytes=10_000, max_request_bytes=5_000, retry_after=7)
+    limiter = ConcurrencyLimiter("upload", max_concurrent=4, max_queue=4, queue_timeout=5, retry_after=7)
+    reserved = []
+
+    async def upload_file_to_transient(file):
+        reserved.append(budget.in_flight)
+        return {"transientDocumentId": "doc-1"}
+
+    monkeypatch.setattr(main.adobe_sign_transient_service, "upload_file_to_transient", upload_file_to_transient)
+    monkeypatch.setitem(main.ROUTE_LIMITERS, ("POST", "/documents/upload"), (limiter, budget))
+
+    def upload(size):
+        return {"method": "POST", "url": "/documents/upload",
+                "files": {"file": ("contract.pdf", b"x" * size, "application/pdf")}}
+
+    accepted, too_large = run_requests([upload(1_000), upload(6_000)])
+
+    assert accepted.status_code == 200
+    # The reservation is the request's real Content-Length, multipart framing included
+    assert 1_000 < reserved[0] < 1_500
+    assert too_large.status_code == 413
+    assert budget.in_flight == 0
+
+    budget.in_flight = 9_500
+    over_budget, = run_requests([upload(1_000)])
+    assert over_budget.status_code == 503
+    assert over_budget.headers["Retry-After"] == "7"
+
+def test_serialization_phase_includes_response_encoding(monkeypatch):
+    class SlowToEncode(BaseModel):
+        id: str
+
+        @field_serializer("id")
+        def slow_id(self, value):
+            time.sleep(0.02)
+            return value
+
+    async def get_agreement(agreement_id):
+        return {"agreement": SlowToEncode(id=agreement_id)}
+
+    monkeypatch.setattr(main.adobe_sign_agreement_service, "get_agreement", get_agreement)
+    monkeypatch.setattr(main.request_profiler, "_slowest", [])
+
+    response, = run_requests([{"method": "GET", "url": "/agreements/agreement-1"}])
+
+    assert response.json() == {"agreement": {"id": "agreement-1"}}
+    record, = main.request_profiler.get_slowest()
+    assert record["phases"]["serialization"] >= 20
+
+def test_cancelled_export_closes_client(monkeypatch):
+    closed = []
+    original_aclose = httpx.AsyncClient.aclose
+
+    async def aclose(self):
+        closed.append(self)
+        await original_aclose(self)
+
+    monkeypatch.setattr(httpx.AsyncClient, "aclose", aclose)
+
+    async def export_then_disconnect():
+        prefetch_started = asyncio.Event()
+
+        async def fetch_page(client, cursor=None, page_size=100):
+            if cursor is None:
+                return {"userAgreementList": [{"id": "a1"}], "page": {"nextCursor": "cursor-2"}}
+            prefetch_started.set()
+            await asyncio.sleep(10)
+
+        monkeypatch.setattr(main.adobe_sign_agreement_service, "_fetch_agreements_page", fetch_page)
+        pages = main.adobe_sign_agreement_service.iter_agreement_pages()
+        first_page = await pages.__anext__()
+
+        async def consume():
+            async for _ in main.stream_agreements_ndjson(pages, first_page, False):
+                pass
+
+        # Starlette cancels a disconnected StreamingResponse through an anyio task group
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(consume)
+            await prefetch_started.wait()
+            task_group.cancel_scope.cancel()
+
+    asyncio.run(export_then_disconnect())
+
+    assert len(closed) == 1
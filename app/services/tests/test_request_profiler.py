@@ -0,0 +1,73 @@
+import asyncio
+import time
+from datetime import datetime
+from app.services.request_profiler import RequestProfiler
+
+def test_phase_timing():
+    profiler = RequestProfiler()
+    phases = profiler.start_request()
+
+    with profiler.phase("upstream_wait"):
+        time.sleep(0.01)
+
+    assert phases["upstream_wait"] >= 10
+    assert phases["token_refresh"] == 0.0
+
+def test_keeps_slowest_requests():
+    profiler = RequestProfiler()
+    profiler.max_records = 2
+    started_at = datetime(2026, 1, 1, 12, 0, 0)
+
+    for duration in (5, 50, 1, 20):
+        profiler.record("GET", f"/slow/{duration}", 200, started_at, duration, {"upstream_wait": 1.0})
+
+    slowest = profiler.get_slowest()
+    assert [r["path"] for r in slowest] == ["/slow/50", "/slow/20"]
+    assert slowest[0]["phases"]["other"] == 49.0
+    assert slowest[0]["started_at"] == "2026-01-01T12:00:00"
+
+def test_slowest_requests_roll_out_of_window():
+    profiler = RequestProfiler()
+    profiler.max_records = 1
+    profiler.window_seconds = 0.01
+
+    profiler.record("GET", "/cold-start", 200, datetime.now(), 500, {})
+    time.sleep(0.02)
+    profiler.record("GET", "/later", 200, datetime.now(), 50, {})
+
+    assert [r["path"] for r in profiler.get_slowest()] == ["/later"]
+
+def test_is_authorized():
+    profiler = RequestProfiler()
+    profiler.token = "secret"
+
+    assert profiler.is_authorized("secret")
+    assert not profiler.is_authorized("wrong")
+    assert not profiler.is_authorized(None)
+
+    profiler.token = None
+    assert not profiler.is_authorized("secret")
+
+def test_sampling_profile_captures_request_work():
+    profiler = RequestProfiler()
+    profiler.sample_interval = 0.001
+
+    def busy_work():
+        end = time.perf_counter() + 0.05
+        while time.perf_counter() < end:
+            pass
+
+    async def profiled_request():
+        phases = profiler.start_request()
+        sampler = profiler.start_profile(phases)
+        busy_work()
+        return profiler.stop_profile(sampler)
+
+    report = asyncio.run(profiled_request())
+
+    assert "busy_work" in report
+    assert not profiler._profile_lock.locked()
+
+if __name__ == "__main__":
+    test_phase_timing()
+    test_keeps_slowest_requests()